@@ -21,24 +21,21 @@ st.set_page_config(
 st.title("Document Extraction AI")
 st.subheader("Extract structured data from your PDFs and images.")
 
+# Get the extractor instance before any upload so it is ready for the first request
+extractor = get_extractor()
+
 # File uploader widget
 uploaded_file = st.file_uploader("Choose a document...", type=["pdf", "jpg", "jpeg", "png"])
 
 if uploaded_file is not None:
-    # A Streamlit file uploader returns a BytesIO object.
-    # We'll save it to a temporary file to be processed by deepdoctection.
-    with open("temp_doc.pdf", "wb") as f:
-        f.write(uploaded_file.getbuffer())
-
-    # Get the extractor instance
-    extractor = get_extractor()
-
+    # A Streamlit file uploader returns a BytesIO object,
+    # which the extractor reads directly without a temporary file.
     # Create a button to trigger the extraction
     if st.button("Start Extraction"):
         with st.spinner("Processing document... This may take a few moments."):
             try:
-                # Call the extraction method on the temporary file
-                extracted_data = extractor.extract_from_document("temp_doc.pdf")
+                # Call the extraction method on the uploaded file
+                extracted_data = extractor.extract_from_document(uploaded_file)
 
                 st.success("Extraction complete!")
 
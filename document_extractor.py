@@ -1,14 +1,95 @@
 import os
-import json
-from typing import Dict, List, Any
+import sys
+import mmap
+import logging
+import logging.handlers
+import multiprocessing
+import shutil
+import hashlib
+import functools
+import contextlib
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, BinaryIO, Iterable, Iterator, Optional, Tuple, Union
+import orjson
+import pypdfium2 as pdfium
 import pytesseract
-from PIL import Image
 from pypdf import PdfReader
+from pypdf.generic import DictionaryObject
 from io import BytesIO
 
+# tesserocr is optional: when installed, OCR runs in-process instead of through the tesseract CLI
+try:
+    from tesserocr import OEM, PyTessBaseAPI
+except ImportError:
+    PyTessBaseAPI = None
+
+logger = logging.getLogger(__name__)
+
 # Explicitly set the path to the tesseract executable
 pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'
 
+# Use the LSTM engine only. The distribution tesseract-ocr-* packages ship the
+# integer "tessdata_fast" models, which are the quickest on AVX2 CPUs.
+TESSERACT_CONFIG = "--oem 1"
+
+# Tesseract's OpenMP threading slows it down overall, parallelism comes from the worker pool
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# Read buffer for PDF files, so pypdf's many small reads and seeks are served from memory
+PDF_BUFFER_SIZE = 1 << 20
+
+# PDF files larger than this are memory-mapped instead, so seeks cost no syscalls at all
+PDF_MMAP_SIZE = 64 << 20
+
+# The page images of an OCR batch go to tmpfs when available, so they never hit the disk
+TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Pages whose text layer has fewer characters than this are OCR'd as well
+MIN_PAGE_CHARS = 50
+
+# A document whose first pages average more text than this is treated as born-digital
+# and never OCR'd
+BORN_DIGITAL_SAMPLE_PAGES = 3
+BORN_DIGITAL_MIN_CHARS = 200
+
+# Images smaller than this in either dimension are icons or bullets, not scans,
+# and do not make a page worth OCR'ing
+MIN_OCR_IMAGE_SIZE = 100
+
+# Form XObjects nested deeper than this are not searched for scanned images
+MAX_FORM_DEPTH = 4
+
+# Scanned pages sent to a worker together, so one Tesseract run covers all of them
+OCR_BATCH_PAGES = 4
+
+# Resolution scanned pages are rendered at for OCR
+OCR_DPI = 200
+
+# Worker processes are started by a fork server where available. Forking the calling
+# process itself is unsafe once it runs threads, like a web server or the log listener.
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None)
+
+# PDFium must not be used from several threads at once, even on different documents
+_PDFIUM_LOCK = threading.Lock()
+
+# OCR results of the rendered pages seen by this process, keyed by the SHA-1 of the image data.
+# Only byte-identical pages hit it, logos or headers repeated on otherwise different pages do not.
+OCR_CACHE_SIZE = 1024
+_OCR_CACHE: Dict[bytes, str] = {}
+_OCR_CACHE_LOCK = threading.Lock()
+
+# The DocumentExtractor of a corpus worker process, created by its pool initializer
+_CORPUS_EXTRACTOR = None
+
+# The tesserocr instance of this process, created on first use
+_TESSERACT_API = None
+_TESSERACT_API_LOCK = threading.Lock()
+
 
 class DocumentExtractor:
     """
@@ -16,96 +97,765 @@ class DocumentExtractor:
     This approach is highly reliable and avoids complex dependencies.
     """
 
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None, cache_dir: Optional[str] = None,
+                 ocr_concurrency: Optional[int] = None):
         """
         Initializes the document extractor.
+
+        Args:
+            workers (Optional[int]): Number of OCR worker processes. Defaults to the
+                EXTRACT_WORKERS environment variable, or one less than the CPU count,
+                and is capped at the CPU count.
+            cache_dir (Optional[str]): Directory for caching extraction results by the
+                SHA-256 of the document contents. Caching is disabled when not set.
+            ocr_concurrency (Optional[int]): Maximum number of pages of a document queued
+                for OCR at once. Defaults to the OCR_CONCURRENCY environment variable, or
+                two batches of pages per worker so the pool never runs dry.
         """
-        print("Initializing DocumentExtractor with pypdf and pytesseract...")
+        logger.info("Initializing DocumentExtractor with pypdf and pytesseract...")
         # Check if tesseract is in PATH
         try:
-            pytesseract.get_tesseract_version()
-            print("Tesseract OCR is available.")
+            logger.info("Tesseract OCR %s is available.", _check_tesseract())
         except pytesseract.TesseractNotFoundError:
-            print("Tesseract is not found. Please ensure it's installed and in PATH.")
+            logger.error("Tesseract is not found. Please ensure it's installed and in PATH.")
             raise
-        print("DocumentExtractor initialized successfully.")
+        if workers is None:
+            workers = int(os.environ.get("EXTRACT_WORKERS", (os.cpu_count() or 2) - 1))
+        self.workers = max(1, min(workers, os.cpu_count() or 1))
+        if ocr_concurrency is None and "OCR_CONCURRENCY" in os.environ:
+            ocr_concurrency = int(os.environ["OCR_CONCURRENCY"])
+        # Left unset, the limit follows the OCR batch size of each document
+        self.ocr_concurrency = None if ocr_concurrency is None else max(1, ocr_concurrency)
+        self.cache_dir = cache_dir
+        # The worker pool is started on first use and reused across documents
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._log_listener = None
+        logger.info("DocumentExtractor initialized successfully.")
 
-    def extract_from_document(self, file_path: str) -> Dict[str, Any]:
+    def extract_from_document(self, file: Union[str, BinaryIO]) -> Dict[str, Any]:
         """
         Extracts text from a PDF file using pypdf and performs OCR on images.
 
         Args:
-            file_path (str): The path to the document file.
+            file (Union[str, BinaryIO]): The path to the document file, or a binary
+                file-like object holding the document (e.g. an uploaded file).
 
         Returns:
             Dict[str, Any]: A dictionary containing the extracted text per page.
         """
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Document not found at {file_path}")
+        return {
+            "file_path": file if isinstance(file, str) else getattr(file, "name", None),
+            "pages": list(self.iter_pages(file))
+        }
 
-        print(f"Processing document: {file_path}")
+    def iter_pages(self, file: Union[str, BinaryIO]) -> Iterator[Dict[str, Any]]:
+        """
+        Extracts text from a PDF file like extract_from_document, one page at a time.
 
-        extracted_data = {
-            "file_path": file_path,
-            "pages": []
-        }
+        The pages can be handed to save_to_json as they are produced, so the full
+        result of a large document never has to be held in memory.
 
-        try:
-            reader = PdfReader(file_path)
-            for page_number, page in enumerate(reader.pages):
-                page_text = page.extract_text()
+        Args:
+            file (Union[str, BinaryIO]): The path to the document file, or a binary
+                file-like object holding the document (e.g. an uploaded file).
 
-                # Check for images and perform OCR if necessary
-                if not page_text.strip():
-                    try:
-                        print(f"No text extracted on page {page_number + 1}, attempting OCR on images...")
-                        page_text = self._extract_text_from_page_images(page)
-                    except Exception as e:
-                        print(f"OCR failed for page {page_number + 1}: {e}")
-                        page_text = ""
+        Yields:
+            Dict[str, Any]: The page number and extracted text of each page, in order.
+        """
+        if isinstance(file, str):
+            try:
+                stream = _open_pdf(file)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"Document not found at {file}") from None
+            file_path = file
+        else:
+            stream = file
+            file_path = getattr(file, "name", None)
+
+        logger.info("Processing document: %s", file_path)
 
-                extracted_data["pages"].append({
-                    "page_number": page_number + 1,
-                    "text": page_text
-                })
+        # The OCR workers open the document themselves to render its scanned pages
+        pdf_path = file if isinstance(file, str) else None
+        try:
+            cache_path = None
+            cached_pages = None
+            if self.cache_dir:
+                cache_path = os.path.join(self.cache_dir, f"{_sha256(stream)}.json")
+                cached_pages = _read_cache(cache_path)
+
+            if cached_pages is not None:
+                logger.info("Using cached extraction result from %s", cache_path)
+                yield from cached_pages
+            elif cache_path:
+                # A result with failed OCR is not cached, so the next extraction tries again
+                failed_pages = []
+                yield from _cache_pages(self._extract_pages(stream, pdf_path, failed_pages),
+                                        cache_path, failed_pages)
+            else:
+                yield from self._extract_pages(stream, pdf_path, [])
 
         except Exception as e:
-            print(f"Error during PDF processing: {e}")
+            logger.error("Error during PDF processing: %s", e)
             raise
+        finally:
+            if stream is not file:
+                stream.close()
 
-        return extracted_data
+    def _extract_pages(self, stream: BinaryIO, pdf_path: Optional[str],
+                       failed_pages: List[int]) -> Iterator[Dict[str, Any]]:
+        """
+        Helper function to extract the text of every page of an open PDF stream.
 
-    def _extract_text_from_page_images(self, page) -> str:
+        pdf_path is the file the stream was opened from, if any. Documents passed as
+        a stream are copied to a temporary file once a page needs OCR. The numbers of
+        pages whose OCR failed are added to failed_pages.
         """
-        Helper function to extract text from images on a single PDF page using Tesseract OCR.
+        reader = PdfReader(stream)
+
+        # Probe the first pages to skip OCR entirely for born-digital documents
+        sample_text = [_page_text(page) for page in reader.pages[:BORN_DIGITAL_SAMPLE_PAGES]]
+        born_digital = bool(sample_text) and (
+            sum(len(text) for text in sample_text) / len(sample_text) > BORN_DIGITAL_MIN_CHARS)
+        if born_digital:
+            logger.info("Document has a dense text layer, skipping OCR...")
+
+        # Batch pages for OCR, but not so much that short documents leave workers idle
+        batch_pages = max(1, min(OCR_BATCH_PAGES, len(reader.pages) // self.workers))
+        # Enough pages queued to keep every worker busy, and at least one full batch
+        max_in_flight = max(self.ocr_concurrency or 2 * self.workers * batch_pages, batch_pages)
+
+        # Pages not handed out yet, in order, with the future of their OCR if they need it
+        pending = deque()
+        ocr_batch = []
+        ocr_in_flight = 0
+        temp_path = None
+        try:
+            for page_number, page in enumerate(reader.pages):
+                if page_number < len(sample_text):
+                    page_text = sample_text[page_number]
+                else:
+                    page_text = _page_text(page)
+                ocr_result = None
+
+                # Pages with little or no text layer but with a large image are likely scans. Only
+                # the image dictionaries are read here, the workers render and OCR the whole page.
+                if (not born_digital and len(page_text.strip()) < MIN_PAGE_CHARS
+                        and _has_scanned_image(page)):
+                    logger.debug("Little text extracted on page %d, queueing it for OCR...", page_number + 1)
+                    if pdf_path is None:
+                        pdf_path = temp_path = _spill_to_file(stream)
+                    # The OCR runs in the workers while the remaining pages are parsed
+                    ocr_result = Future()
+                    ocr_batch.append((page_number, ocr_result))
+                    ocr_in_flight += 1
+                    if len(ocr_batch) == batch_pages:
+                        self._start_ocr(pdf_path, ocr_batch)
+                        ocr_batch = []
+
+                pending.append((page_number, page_text, ocr_result))
+
+                # Hand out the pages that are done, and wait for the oldest OCR once too many
+                # are queued, so rendered pages never pile up in the workers
+                while pending and (pending[0][2] is None or pending[0][2].done()
+                                   or ocr_in_flight > max_in_flight):
+                    if pending[0][2] is not None:
+                        # Only send a partial batch when the page waited for is in it, otherwise
+                        # the batch keeps filling up while the started ones are OCR'd
+                        if ocr_batch and ocr_batch[0][1] is pending[0][2]:
+                            self._start_ocr(pdf_path, ocr_batch)
+                            ocr_batch = []
+                        ocr_in_flight -= 1
+                    yield _page_record(*pending.popleft(), failed_pages)
+
+            if ocr_batch:
+                self._start_ocr(pdf_path, ocr_batch)
+            while pending:
+                yield _page_record(*pending.popleft(), failed_pages)
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
+    def _start_ocr(self, pdf_path: str, batch: List[Tuple[int, Future]]):
+        """
+        Helper function to start OCR on a batch of pages in the pool of worker processes.
+
+        Each page comes with a future that receives its text once the batch is done,
+        so the caller can keep parsing the next pages while the workers are busy.
         """
-        text_from_images = []
-        for image_file_obj in page.images:
+        page_numbers = [page_number for page_number, _ in batch]
+        page_futures = [future for _, future in batch]
+
+        def set_page_results(batch_future: Future):
+            if batch_future.exception() is not None:
+                for future in page_futures:
+                    future.set_exception(batch_future.exception())
+                return
+            for future, page_text in zip(page_futures, batch_future.result()):
+                future.set_result(page_text)
+
+        if self.workers == 1:
+            batch_future = Future()
+            batch_future.set_result(_ocr_pages(pdf_path, page_numbers))
+        else:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._start_pool()
+                try:
+                    batch_future = self._pool.submit(_ocr_pages, pdf_path, page_numbers)
+                except BrokenProcessPool:
+                    # A worker died, e.g. killed for running out of memory, which breaks the
+                    # whole pool. Replace it so this and later documents can still be OCR'd.
+                    logger.warning("OCR worker pool is broken, starting a new one...")
+                    self._shutdown_pool()
+                    self._start_pool()
+                    batch_future = self._pool.submit(_ocr_pages, pdf_path, page_numbers)
+        batch_future.add_done_callback(set_page_results)
+
+    def _start_pool(self):
+        """
+        Helper function to start the pool of OCR worker processes. Must be called with _pool_lock held.
+        """
+        # Workers hand their log records to the main process through a queue,
+        # where a single thread emits them with the logging setup of the application
+        log_queue = _MP_CONTEXT.Queue()
+        self._log_listener = logging.handlers.QueueListener(log_queue, _LogForwarder())
+        self._log_listener.start()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_MP_CONTEXT,
+                                         initializer=_init_worker,
+                                         initargs=(log_queue, logger.getEffectiveLevel(),
+                                                   pytesseract.pytesseract.tesseract_cmd))
+
+    def _shutdown_pool(self):
+        """
+        Helper function to shut down the pool of OCR worker processes. Must be called with _pool_lock held.
+        """
+        self._pool.shutdown()
+        self._pool = None
+        self._log_listener.stop()
+        self._log_listener = None
+
+    def close(self):
+        """
+        Shuts down the OCR worker pool, if one was started.
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._shutdown_pool()
+
+
+def extract_corpus(paths: Iterable[str], output_dir: str, workers: Optional[int] = None,
+                   cache_dir: Optional[str] = None) -> Iterator[str]:
+    """
+    Extracts text from many PDF files in parallel and saves each result to a JSON file.
+
+    Each worker process extracts whole documents with a DocumentExtractor of its
+    own, which runs OCR inline, so a corpus keeps every CPU busy without nesting
+    process pools. Documents that fail are logged and skipped.
+
+    Args:
+        paths (Iterable[str]): The paths of the document files.
+        output_dir (str): Directory the results are saved to, as JSON files named
+            after the documents. Documents sharing a name get a numbered suffix.
+        workers (Optional[int]): Number of worker processes. Defaults to the CPU count.
+        cache_dir (Optional[str]): Directory for caching extraction results, see
+            DocumentExtractor.
+
+    Yields:
+        str: The path of each JSON file written, in the order the documents finish.
+    """
+    # A missing Tesseract must reach the caller here: raised in the pool initializer,
+    # it would only make the pool respawn failing workers forever
+    _check_tesseract()
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = list(paths)
+    tasks = list(zip(paths, _output_paths(paths, output_dir)))
+    log_queue = _MP_CONTEXT.Queue()
+    log_listener = logging.handlers.QueueListener(log_queue, _LogForwarder())
+    log_listener.start()
+    try:
+        with _MP_CONTEXT.Pool(workers or os.cpu_count(), initializer=_init_corpus_worker,
+                              initargs=(log_queue, logger.getEffectiveLevel(),
+                                        pytesseract.pytesseract.tesseract_cmd, cache_dir)) as pool:
+            # Documents differ a lot in size, so they are handed out one at a time
+            for output_path in pool.imap_unordered(_extract_one, tasks):
+                if output_path is not None:
+                    yield output_path
+    finally:
+        log_listener.stop()
+
+
+def _output_paths(paths: List[str], output_dir: str) -> List[str]:
+    """
+    Helper function to name the JSON file of each document of a corpus.
+
+    Files are named after the documents, with a numbered suffix for documents
+    whose names are already taken, so no result overwrites another one.
+    """
+    output_paths = []
+    taken = set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = stem
+        number = 1
+        # Compared case-insensitively, as some file systems are
+        while name.casefold() in taken:
+            number += 1
+            name = f"{stem}_{number}"
+        taken.add(name.casefold())
+        output_paths.append(os.path.join(output_dir, name + ".json"))
+    return output_paths
+
+
+def _init_corpus_worker(log_queue: multiprocessing.Queue, log_level: int, tesseract_cmd: str,
+                        cache_dir: Optional[str]):
+    """
+    Sets up a corpus worker process with its logging and its own DocumentExtractor.
+    """
+    global _CORPUS_EXTRACTOR
+    _init_worker(log_queue, log_level, tesseract_cmd)
+    # Pool workers cannot start processes of their own, so OCR runs inline in each of them.
+    # Errors are not raised here, the pool would keep replacing the failed worker.
+    try:
+        _CORPUS_EXTRACTOR = DocumentExtractor(workers=1, cache_dir=cache_dir)
+    except Exception as e:
+        logger.error("Failed to set up a corpus worker: %s", e)
+
+
+def _extract_one(task: Tuple[str, str]) -> Optional[str]:
+    """
+    Extracts a single document of a corpus in a worker process and returns the path of its JSON file.
+    """
+    path, output_path = task
+    if _CORPUS_EXTRACTOR is None:
+        logger.error("Failed to extract %s: the worker could not be set up", path)
+        return None
+    try:
+        save_to_json({"file_path": path, "pages": _CORPUS_EXTRACTOR.iter_pages(path)}, output_path)
+    except Exception as e:
+        logger.error("Failed to extract %s: %s", path, e)
+        # Do not leave a truncated result behind
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return None
+    return output_path
+
+
+@functools.lru_cache(maxsize=1)
+def _check_tesseract() -> str:
+    """
+    Returns the version of the tesseract executable, asking it only once per process.
+
+    A failed check raises and is not cached, so a later call looks again.
+    """
+    return str(pytesseract.get_tesseract_version())
+
+
+class _LogForwarder(logging.Handler):
+    """
+    Emits log records received from the OCR workers through the logger they were logged to.
+    """
+
+    def emit(self, record: logging.LogRecord):
+        logging.getLogger(record.name).handle(record)
+
+
+def _init_worker(log_queue: multiprocessing.Queue, log_level: int, tesseract_cmd: str):
+    """
+    Sets up an OCR worker process to send its log records to the main process, and
+    to run the same tesseract executable as the main process.
+    """
+    logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(log_level)
+    # Records only go through the queue, not through any handler of this process
+    logger.propagate = False
+    # The worker imports this module afresh, an executable set by the application would be lost
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _page_text(page) -> str:
+    """
+    Extracts the text layer of a page.
+
+    Text can only be drawn with a font, so pages whose resources hold no fonts,
+    and no form XObjects that could bring their own, are skipped without running
+    pypdf's content stream parser over them. That is the case for most scans.
+    Whenever the resources are not what they should be, for example a reference
+    to an object missing from the file, the page is left to pypdf, which copes.
+    """
+    if "/Resources" not in page:
+        return ""
+    resources = page["/Resources"]
+    if not isinstance(resources, DictionaryObject):
+        return page.extract_text()
+    if "/Font" in resources and resources["/Font"]:
+        return page.extract_text()
+    if "/XObject" not in resources:
+        return ""
+
+    xobjects = resources["/XObject"]
+    if not isinstance(xobjects, DictionaryObject):
+        return page.extract_text()
+    for name in xobjects:
+        xobject = xobjects[name]
+        if not isinstance(xobject, DictionaryObject) or xobject.get("/Subtype") != "/Image":
+            return page.extract_text()
+    return ""
+
+
+def _has_scanned_image(page) -> bool:
+    """
+    Tells whether a page draws an image large enough to be worth OCR'ing.
+
+    The sizes in the image dictionaries of the page and its form XObjects are looked
+    at first, without reading any image data. Only when none of them is large enough
+    is the content stream parsed for inline images, which some scanners store pages
+    as. Malformed resources count as no scan, so they only cost the page its OCR.
+    """
+    try:
+        return _has_large_image_xobject(page) or _has_large_inline_image(page)
+    except Exception as e:
+        logger.warning("Failed to look for images to OCR: %s", e)
+        return False
+
+
+def _has_large_image_xobject(obj, depth: int = 0) -> bool:
+    """
+    Helper function to look for a large image XObject on a page or in a form XObject.
+    """
+    resources = obj["/Resources"] if "/Resources" in obj else None
+    if not isinstance(resources, DictionaryObject) or "/XObject" not in resources:
+        return False
+    xobjects = resources["/XObject"]
+    if not isinstance(xobjects, DictionaryObject):
+        return False
+
+    for name in xobjects:
+        xobject = xobjects[name]
+        # Broken references resolve to None, there is nothing to draw there
+        if not isinstance(xobject, DictionaryObject):
+            continue
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            size = [xobject[key] if key in xobject else None for key in ("/Width", "/Height")]
+            if all(isinstance(n, (int, float)) for n in size) and min(size) >= MIN_OCR_IMAGE_SIZE:
+                return True
+        elif subtype == "/Form" and depth < MAX_FORM_DEPTH and _has_large_image_xobject(xobject, depth + 1):
+            return True
+    return False
+
+
+def _has_large_inline_image(page) -> bool:
+    """
+    Helper function to look for a large inline image in the content stream of a page.
+    """
+    # pypdf names inline images ~0~, ~1~ and so on
+    for name in page.images.keys():
+        if isinstance(name, str) and name.startswith("~") and name.endswith("~"):
+            if min(page.images[name].image.size) >= MIN_OCR_IMAGE_SIZE:
+                return True
+    return False
+
+
+def _page_record(page_number: int, page_text: str, ocr_result: Optional[Future],
+                 failed_pages: List[int]) -> Dict[str, Any]:
+    """
+    Builds the output record of a page, waiting for its OCR text if it has any.
+
+    A page whose OCR failed keeps its text layer and is added to failed_pages.
+    """
+    if ocr_result is not None:
+        ocr_text = ocr_result.result()
+        if ocr_text is None:
+            failed_pages.append(page_number + 1)
+        # Keep the text layer if OCR did not recover more than it
+        elif len(ocr_text.strip()) > len(page_text.strip()):
+            page_text = ocr_text
+
+    return {
+        "page_number": page_number + 1,
+        "text": page_text
+    }
+
+
+def _open_pdf(file_path: str) -> BinaryIO:
+    """
+    Opens a PDF file for reading with a large buffer, or memory-mapped if it is big.
+    """
+    f = open(file_path, "rb", buffering=PDF_BUFFER_SIZE)
+    if os.fstat(f.fileno()).st_size < PDF_MMAP_SIZE:
+        return f
+
+    # The mapping stays valid after the file itself is closed
+    with f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _spill_to_file(stream: BinaryIO) -> str:
+    """
+    Copies a PDF stream to a temporary file the OCR workers can open, and returns its path.
+
+    The copy goes to the regular temporary directory, not TEMP_DIR: a large scan
+    would easily fill a small tmpfs such as the 64 MB /dev/shm of a container.
+    """
+    stream.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        shutil.copyfileobj(stream, f, PDF_BUFFER_SIZE)
+    return f.name
+
+
+def _sha256(stream: BinaryIO) -> str:
+    """
+    Returns the SHA-256 hex digest of a binary stream and rewinds it for reading.
+    """
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(PDF_BUFFER_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def _read_cache(cache_path: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Returns the pages stored in a cache file, or None if there is no usable one.
+    """
+    try:
+        with open(cache_path, "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError) as e:
+        logger.warning("Failed to read cache entry %s: %s", cache_path, e)
+        return None
+
+
+def _cache_pages(pages: Iterable[Dict[str, Any]], cache_path: str,
+                 failed_pages: List[int]) -> Iterator[Dict[str, Any]]:
+    """
+    Passes pages through while writing them to a cache file as a JSON array.
+
+    The pages are written to a temporary file of their own, which only appears under
+    the final name once every page has been written. An interrupted extraction never
+    leaves a truncated cache entry behind, and extractions of the same document that
+    overlap do not write over each other. A cache entry that cannot be written is
+    logged and dropped, the extraction itself carries on.
+
+    Nothing is cached if any page number ended up in failed_pages by the time the
+    last page has passed, so pages whose OCR failed are retried next time instead
+    of coming back empty for good.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    partial = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        partial = tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".part", delete=False)
+        partial.write(b"[")
+    except OSError as e:
+        partial = _drop_cache_file(partial, cache_path, e)
+
+    try:
+        for index, page in enumerate(pages):
+            if partial is not None:
+                try:
+                    partial.write((b"," if index else b"") + orjson.dumps(page))
+                except OSError as e:
+                    partial = _drop_cache_file(partial, cache_path, e)
+            yield page
+    except BaseException:
+        _drop_cache_file(partial, cache_path)
+        raise
+
+    if partial is not None and failed_pages:
+        logger.warning("Not caching the result of %s, OCR failed on pages %s",
+                       cache_path, ", ".join(map(str, failed_pages)))
+        partial = _drop_cache_file(partial, cache_path)
+    if partial is not None:
+        try:
+            partial.write(b"]")
+            partial.close()
+            os.replace(partial.name, cache_path)
+        except OSError as e:
+            _drop_cache_file(partial, cache_path, e)
+
+
+def _drop_cache_file(partial, cache_path: str, error: Optional[OSError] = None) -> None:
+    """
+    Helper function to close and remove an unfinished cache file, logging the error that stopped it.
+    """
+    if error is not None:
+        logger.warning("Failed to write cache entry %s: %s", cache_path, error)
+    if partial is not None:
+        with contextlib.suppress(OSError):
+            partial.close()
+        with contextlib.suppress(OSError):
+            os.remove(partial.name)
+    return None
+
+
+def _ocr_pages(pdf_path: str, page_numbers: List[int]) -> List[Optional[str]]:
+    """
+    Renders several pages of a PDF file and runs OCR on them in one batch, returning the text of each page.
+
+    The text is None for pages that could not be OCR'd.
+    """
+    try:
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_path)
             try:
-                # Read the image data
-                image_data = image_file_obj.data
-                image = Image.open(BytesIO(image_data))
+                images = []
+                for page_number in page_numbers:
+                    page = pdf[page_number]
+                    try:
+                        images.append(_render_page(page))
+                    finally:
+                        page.close()
+            finally:
+                pdf.close()
+        return _ocr_images(images)
+    except Exception as e:
+        logger.warning("OCR failed for pages %s: %s",
+                       ", ".join(str(page_number + 1) for page_number in page_numbers), e)
+        return [None] * len(page_numbers)
+
+
+def _render_page(page) -> bytes:
+    """
+    Renders a PDFium page to a grayscale PNG image at OCR_DPI.
+
+    The whole page is OCR'd at once, so text split over several images keeps its
+    layout, and Tesseract runs once per page however many images it is made of.
+
+    The bitmap and the Pillow image sharing its buffer are released as soon as
+    the PNG is encoded, so a batch holds only compressed pages in memory.
+    """
+    bitmap = page.render(scale=OCR_DPI / 72, grayscale=True)
+    try:
+        with bitmap.to_pil() as image, BytesIO() as buffer:
+            # Tesseract decodes the image again right away, fast compression is enough
+            image.save(buffer, format="PNG", compress_level=1)
+            return buffer.getvalue()
+    finally:
+        bitmap.close()
+
+
+def _ocr_images(images: List[bytes]) -> List[Optional[str]]:
+    """
+    Runs Tesseract OCR over a batch of images and returns the text of each image,
+    which is None for images that could not be OCR'd. Failures are not cached.
+
+    Images this process has already OCR'd are answered from a cache keyed by the
+    SHA-1 of their data. The images are whole rendered pages, so this only helps
+    with pages that render identically, such as blank separator sheets or a
+    document that is extracted again.
+    """
+    keys = [hashlib.sha1(image_data).digest() for image_data in images]
+    # Inline OCR runs in the threads of the calling application, which share the cache
+    with _OCR_CACHE_LOCK:
+        texts = {key: _OCR_CACHE[key] for key in keys if key in _OCR_CACHE}
+
+    new_images = {key: image_data for key, image_data in zip(keys, images) if key not in texts}
+    if new_images:
+        new_texts = _run_tesseract(new_images)
+        texts.update(new_texts)
+        with _OCR_CACHE_LOCK:
+            _OCR_CACHE.update(new_texts)
+            # Drop the oldest entries once the cache is full
+            while len(_OCR_CACHE) > OCR_CACHE_SIZE:
+                del _OCR_CACHE[next(iter(_OCR_CACHE))]
+
+    return [texts.get(key) for key in keys]
+
+
+def _run_tesseract(images: Dict[bytes, bytes]) -> Dict[bytes, str]:
+    """
+    Runs Tesseract over a batch of PNG images and returns the text of each image
+    by key, leaving out the images Tesseract failed on.
+
+    The images are written to a temporary directory and read from there by the
+    tesserocr instance of this process, or otherwise handed to the tesseract CLI
+    as a single file list, so the engine and language model are loaded once per
+    batch instead of once per image.
+    """
+    with tempfile.TemporaryDirectory(dir=TEMP_DIR) as temp_dir:
+        image_keys = []
+        image_paths = []
+        for index, (key, image_data) in enumerate(images.items()):
+            image_path = os.path.join(temp_dir, f"{index}.png")
+            with open(image_path, "wb") as f:
+                f.write(image_data)
+            image_paths.append(image_path)
+            image_keys.append(key)
+
+        if PyTessBaseAPI is not None:
+            texts = _run_tesseract_api(image_paths)
+        else:
+            list_path = os.path.join(temp_dir, "pages.txt")
+            with open(list_path, "w") as f:
+                f.write("\n".join(image_paths))
+
+            output = pytesseract.image_to_string(list_path, config=TESSERACT_CONFIG)
 
-                # Perform OCR using Tesseract
-                ocr_text = pytesseract.image_to_string(image)
-                text_from_images.append(ocr_text)
+            # Tesseract ends the text of every image in the list with a form feed
+            texts = output.split("\f")[:len(image_paths)]
+
+    return {key: text for key, text in zip(image_keys, texts) if text is not None}
+
+
+def _run_tesseract_api(image_paths: List[str]) -> List[Optional[str]]:
+    """
+    Runs OCR on image files with the tesserocr instance of this process, returning
+    None for the images it failed on.
+
+    The instance is created on first use and kept for the life of the process, so
+    each worker starts Tesseract and loads the language model only once. Leptonica
+    decodes the files itself, so no Pillow image is built on the way.
+    """
+    global _TESSERACT_API
+    texts = []
+    # A Tesseract instance must not be used from several threads at once
+    with _TESSERACT_API_LOCK:
+        if _TESSERACT_API is None:
+            _TESSERACT_API = PyTessBaseAPI(oem=OEM.LSTM_ONLY)
+        for image_path in image_paths:
+            try:
+                _TESSERACT_API.SetImageFile(image_path)
+                texts.append(_TESSERACT_API.GetUTF8Text())
             except Exception as e:
-                print(f"Failed to process an image with OCR: {e}")
+                logger.warning("Failed to process an image with OCR: %s", e)
+                texts.append(None)
 
-        return "\n".join(text_from_images)
+    return texts
 
 
 def save_to_json(data: Dict[str, Any], output_path: str):
     """
-    Saves a dictionary to a JSON file.
+    Saves an extraction result to a JSON file.
+
+    The pages are written one at a time, so data["pages"] may be any iterable of
+    page dictionaries, such as DocumentExtractor.iter_pages(), and each page is
+    written out as soon as it is extracted.
     """
-    with open(output_path, "w") as f:
-        json.dump(data, f, indent=4)
-    print(f"Extraction result saved to {output_path}")
+    with open(output_path, "wb") as f:
+        f.write(b'{"file_path":' + orjson.dumps(data["file_path"]) + b',"pages":[\n')
+        for index, page in enumerate(data["pages"]):
+            if index:
+                f.write(b",\n")
+            f.write(orjson.dumps(page))
+        f.write(b"\n]}\n")
+    logger.info("Extraction result saved to %s", output_path)
 
 
 if __name__ == "__main__":
     sample_pdf_path = "sample.pdf"
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if len(sys.argv) > 1:
+        # Documents given on the command line are extracted in parallel, one per worker
+        for output_path in extract_corpus(sys.argv[1:], "extracted_data"):
+            print(f"Saved {output_path}")
+        exit()
+
     if not os.path.exists(sample_pdf_path):
         print("Please place a PDF file named 'sample.pdf' in the same directory.")
         with open(sample_pdf_path, "w") as f:
@@ -113,10 +863,18 @@ if __name__ == "__main__":
         print("A dummy file 'sample.pdf' has been created.")
         exit()
 
+    def summarize(pages):
+        """Prints a short summary of each page on its way to the JSON file."""
+        print("\n--- Summary of Extracted Data ---")
+        for page in pages:
+            print(f"Page {page['page_number']}:")
+            print(f"  - Text: {page['text'][:100]}...")
+            yield page
+
+    # Each page is written out as soon as it is extracted, the document is never held in memory
     extractor = DocumentExtractor()
-    extracted_info = extractor.extract_from_document(sample_pdf_path)
-    save_to_json(extracted_info, "extracted_data.json")
-    print("\n--- Summary of Extracted Data ---")
-    for page in extracted_info["pages"]:
-        print(f"Page {page['page_number']}:")
-        print(f"  - Text: {page['text'][:100]}...")
\ No newline at end of file
+    try:
+        pages = summarize(extractor.iter_pages(sample_pdf_path))
+        save_to_json({"file_path": sample_pdf_path, "pages": pages}, "extracted_data.json")
+    finally:
+        extractor.close()
\ No newline at end of file